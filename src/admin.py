@@ -4,14 +4,36 @@ Web-based interface for managing feed transformation rules
 """
 
 import os
-import json
 import csv
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
 from pathlib import Path
 from datetime import datetime
+
+import orjson
 from flask import Flask, render_template, request, jsonify, send_file
-from src.transformer import transform_feed, transform_row_to_openai, parse_json_field, COMPANY_CONFIG
+from flask.json.provider import JSONProvider
+from src.transformer import (transform_feed, transform_row_to_openai, parse_json_field, reset_worker_pool,
+                             set_company_config)
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson (keys stay sorted like Flask's default)."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__, template_folder='../templates', static_folder='../static')
+app.json = OrjsonProvider(app)
 
 # Paths
 BASE_DIR = Path(__file__).parent.parent
@@ -19,22 +41,58 @@ CONFIG_DIR = BASE_DIR / 'config'
 OUTPUT_DIR = BASE_DIR / 'output'
 UPLOADS_DIR = BASE_DIR / 'uploads'
 
+# Uploaded feeds are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Worker processes used for feed transforms
+TRANSFORM_WORKERS = int(os.environ.get('TRANSFORM_WORKERS', os.cpu_count() or 1))
+
+# Transforms run as background jobs; at most this many run at once, the rest queue.
+# Each job already fans rows out to TRANSFORM_WORKERS processes, so threads suffice here.
+TRANSFORM_JOBS = int(os.environ.get('TRANSFORM_JOBS', 1))
+_transform_executor = ThreadPoolExecutor(max_workers=TRANSFORM_JOBS, thread_name_prefix='transform')
+
+# Finished transform jobs stay pollable for this many seconds, then are dropped
+TRANSFORM_JOB_TTL = 3600
+
+# Job status files, one <job_id>.json per transform, so any server process can
+# answer a status poll. Dot-prefixed, so it never shows up in output listings.
+JOBS_DIR = OUTPUT_DIR / '.jobs'
+
 # Ensure directories exist
 UPLOADS_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
+JOBS_DIR.mkdir(exist_ok=True)
+
+# Raw config file contents keyed by filename, stored as (mtime_ns, bytes)
+_CONFIG_CACHE = {}
 
 # Load/save configuration
 def load_config(filename):
+    """
+    Load a config file, re-reading it only when its mtime changes. The cached
+    bytes are parsed on every call, so each caller gets its own dict to modify.
+    """
     filepath = CONFIG_DIR / filename
-    if filepath.exists():
-        with open(filepath, 'r') as f:
-            return json.load(f)
-    return {}
+    try:
+        mtime_ns = filepath.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {}
+
+    cached = _CONFIG_CACHE.get(filename)
+    if cached and cached[0] == mtime_ns:
+        return orjson.loads(cached[1])
+
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    _CONFIG_CACHE[filename] = (mtime_ns, raw)
+    return orjson.loads(raw)
 
 def save_config(filename, data):
     filepath = CONFIG_DIR / filename
-    with open(filepath, 'w') as f:
-        json.dump(data, f, indent=2)
+    with open(filepath, 'wb') as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    _CONFIG_CACHE.pop(filename, None)
 
 def load_rules():
     return load_config('rules.json')
@@ -48,6 +106,54 @@ def load_company_config():
 def save_company_config(config):
     save_config('company.json', config)
 
+# Directory listings keyed by (directory, patterns), stored as (mtime_ns, entries)
+# where each entry is (path, st_mtime_ns, st_size, file_info)
+_LISTING_CACHE = {}
+
+def _file_info(name, st):
+    return {
+        'name': name,
+        'size': st.st_size,
+        'modified': datetime.fromtimestamp(st.st_mtime).isoformat()
+    }
+
+def list_files(directory, patterns):
+    """
+    List files matching any pattern. The directory is re-scanned only when its
+    mtime changes; files overwritten in place are caught by re-stat'ing each one.
+    """
+    key = (directory, patterns)
+    mtime_ns = directory.stat().st_mtime_ns
+    cached = _LISTING_CACHE.get(key)
+    if cached and cached[0] == mtime_ns:
+        entries = []
+        for path, file_mtime_ns, size, info in cached[1]:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                break
+            if st.st_mtime_ns != file_mtime_ns or st.st_size != size:
+                info = _file_info(info['name'], st)
+            entries.append((path, st.st_mtime_ns, st.st_size, info))
+        else:
+            _LISTING_CACHE[key] = (mtime_ns, entries)
+            return [entry[3] for entry in entries]
+
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.startswith('.') or not any(fnmatchcase(entry.name, p) for p in patterns):
+                continue
+            st = entry.stat()
+            entries.append((entry.path, st.st_mtime_ns, st.st_size, _file_info(entry.name, st)))
+    _LISTING_CACHE[key] = (mtime_ns, entries)
+    return [entry[3] for entry in entries]
+
+def invalidate_listing(directory):
+    """Drop cached listings for a directory whose files were just written"""
+    for key in [k for k in _LISTING_CACHE if k[0] == directory]:
+        del _LISTING_CACHE[key]
+
 
 # Routes
 @app.route('/')
@@ -57,8 +163,8 @@ def index():
     stats_file = OUTPUT_DIR / 'last_transform_stats.json'
     stats = {}
     if stats_file.exists():
-        with open(stats_file, 'r') as f:
-            stats = json.load(f)
+        with open(stats_file, 'rb') as f:
+            stats = orjson.loads(f.read())
 
     return render_template('index.html', stats=stats)
 
@@ -106,8 +212,9 @@ def update_settings():
     """Save company settings"""
     config = request.json
     save_company_config(config)
-    # Update in-memory config
-    COMPANY_CONFIG.update(config)
+    # Update in-memory config, and restart transform workers so they pick it up
+    set_company_config(config)
+    reset_worker_pool()
     return jsonify({'status': 'success', 'message': 'Settings saved successfully'})
 
 
@@ -141,25 +248,10 @@ def preview_transform():
 def transform_page():
     """Feed transformation page"""
     # List available feeds in uploads directory
-    feeds = []
-    for f in UPLOADS_DIR.glob('*.csv'):
-        feeds.append({
-            'name': f.name,
-            'size': f.stat().st_size,
-            'modified': datetime.fromtimestamp(f.stat().st_mtime).isoformat()
-        })
+    feeds = list_files(UPLOADS_DIR, ('*.csv',))
 
     # List output files (JSONL for OpenAI, TSV/CSV for Gemini)
-    outputs = []
-    for pattern in ['*.jsonl*', '*.tsv', '*.csv']:
-        for f in OUTPUT_DIR.glob(pattern):
-            # Avoid duplicates if file matches multiple patterns
-            if not any(o['name'] == f.name for o in outputs):
-                outputs.append({
-                    'name': f.name,
-                    'size': f.stat().st_size,
-                    'modified': datetime.fromtimestamp(f.stat().st_mtime).isoformat()
-                })
+    outputs = list_files(OUTPUT_DIR, ('*.jsonl*', '*.tsv', '*.csv'))
 
     return render_template('transform.html', feeds=feeds, outputs=outputs)
 
@@ -178,11 +270,12 @@ def upload_feed():
         return jsonify({'status': 'error', 'message': 'Only CSV files are supported'}), 400
 
     filepath = UPLOADS_DIR / file.filename
-    file.save(filepath)
+    with open(filepath, 'wb', buffering=UPLOAD_CHUNK_SIZE) as out:
+        shutil.copyfileobj(file.stream, out, length=UPLOAD_CHUNK_SIZE)
+    invalidate_listing(UPLOADS_DIR)
 
     # Count rows
-    with open(filepath, 'r', encoding='utf-8') as f:
-        row_count = sum(1 for _ in csv.reader(f)) - 1  # Subtract header
+    row_count = count_csv_rows(filepath)
 
     return jsonify({
         'status': 'success',
@@ -193,7 +286,7 @@ def upload_feed():
 
 @app.route('/api/transform', methods=['POST'])
 def run_transform():
-    """Run feed transformation"""
+    """Start a feed transformation in the background and return its job id"""
     data = request.json
     input_file = data.get('input_file')
     output_format = data.get('format', 'openai')
@@ -211,6 +304,98 @@ def run_transform():
     if not input_path.exists():
         return jsonify({'status': 'error', 'message': f'Input file not found at {input_path}'}), 404
 
+    job_id = uuid.uuid4().hex
+    submit_transform_job(job_id, input_file, input_path, output_format, compress)
+
+    return jsonify({
+        'status': 'accepted',
+        'job_id': job_id
+    }), 202
+
+
+@app.route('/api/transform_status/<job_id>')
+def transform_status(job_id):
+    """Report whether a transform job is still running, and its stats once done"""
+    job = read_job_status(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Unknown job'}), 404
+
+    if job['status'] == 'running' and not _process_alive(job['pid']):
+        # The server process running the job exited before it finished
+        job = {'status': 'error', 'message': 'Transform was interrupted'}
+        write_job_status(job_id, job)
+
+    if job['status'] == 'error':
+        return jsonify(job), 500
+    return jsonify(job)
+
+
+def _job_path(job_id):
+    return JOBS_DIR / f'{job_id}.json'
+
+
+def read_job_status(job_id):
+    """Load a job's status record, or None for an unknown (or malformed) job id"""
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return None
+    try:
+        with open(_job_path(job_id), 'rb') as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def write_job_status(job_id, job):
+    """Replace a job's status record atomically, so readers never see a partial file"""
+    tmp_path = JOBS_DIR / f'.{job_id}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(job))
+    os.replace(tmp_path, _job_path(job_id))
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _prune_job_statuses():
+    """Delete status files of jobs that finished more than TRANSFORM_JOB_TTL ago"""
+    cutoff = time.time() - TRANSFORM_JOB_TTL
+    for path in JOBS_DIR.glob('*.json'):
+        try:
+            if path.stat().st_mtime >= cutoff:
+                continue
+            with open(path, 'rb') as f:
+                if orjson.loads(f.read())['status'] == 'running':
+                    continue
+            path.unlink()
+        except (FileNotFoundError, orjson.JSONDecodeError):
+            continue
+
+
+def submit_transform_job(job_id, *args):
+    """Record a new transform job as running and queue it on this process's executor"""
+    _prune_job_statuses()
+    write_job_status(job_id, {'status': 'running', 'pid': os.getpid()})
+    _transform_executor.submit(_run_transform_job, job_id, *args)
+
+
+def _run_transform_job(job_id, *args):
+    try:
+        stats = transform_job(*args)
+    except Exception as e:
+        write_job_status(job_id, {'status': 'error', 'message': str(e)})
+    else:
+        write_job_status(job_id, {'status': 'success', 'stats': stats})
+
+
+def transform_job(input_file, input_path, output_format, compress):
+    """Run one feed transformation and record its stats for the dashboard"""
     # Generate output filename based on format
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
 
@@ -220,28 +405,25 @@ def run_transform():
             from src.gemini_transformer import transform_feed_to_google
             output_filename = f'gemini_feed_{timestamp}'
             output_path = OUTPUT_DIR / output_filename
-            stats = transform_feed_to_google(str(input_path), str(output_path), output_format='tsv')
+            stats = transform_feed_to_google(str(input_path), str(output_path), output_format='tsv',
+                                             workers=TRANSFORM_WORKERS)
         else:
             # OpenAI format - JSONL with optional gzip
             output_filename = f'{output_format}_feed_{timestamp}.jsonl'
             output_path = OUTPUT_DIR / output_filename
-            stats = transform_feed(str(input_path), str(output_path), compress=compress)
+            stats = transform_feed(str(input_path), str(output_path), compress=compress,
+                                   workers=TRANSFORM_WORKERS)
 
         # Save stats for dashboard
         stats['timestamp'] = datetime.now().isoformat()
         stats['input_file'] = input_file
-        with open(OUTPUT_DIR / 'last_transform_stats.json', 'w') as f:
-            json.dump(stats, f, indent=2)
+        with open(OUTPUT_DIR / 'last_transform_stats.json', 'wb') as f:
+            f.write(orjson.dumps(stats, option=orjson.OPT_INDENT_2))
+    finally:
+        # Also after a failed run, which may leave a partial output file behind
+        invalidate_listing(OUTPUT_DIR)
 
-        return jsonify({
-            'status': 'success',
-            'stats': stats
-        })
-    except Exception as e:
-        return jsonify({
-            'status': 'error',
-            'message': str(e)
-        }), 500
+    return stats
 
 
 @app.route('/api/download/<filename>')
@@ -256,7 +438,7 @@ def download_file(filename):
 @app.route('/api/validate/<filename>')
 def validate_output(filename):
     """Validate an output file against OpenAI Commerce Feed schema"""
-    from src.validate_feed import load_feed, validate_product, OPENAI_COMMERCE_SCHEMA
+    from src.validate_feed import load_feed, validate_product, OPENAI_COMMERCE_SCHEMA, SCHEMA_FIELDS
 
     filepath = OUTPUT_DIR / filename
     if not filepath.exists():
@@ -264,14 +446,15 @@ def validate_output(filename):
 
     try:
         products = load_feed(str(filepath))
-        validation_results = [validate_product(p, i) for i, p in enumerate(products)]
+        presence = dict.fromkeys(SCHEMA_FIELDS, 0)
+        validation_results = [validate_product(p, i, presence) for i, p in enumerate(products)]
 
         # Calculate field coverage
         field_coverage = {}
         for category, fields in OPENAI_COMMERCE_SCHEMA.items():
             field_coverage[category] = {}
             for field in fields:
-                present = sum(1 for p in products if field in p and p[field])
+                present = presence[field]
                 field_coverage[category][field] = {
                     "present": present,
                     "total": len(products),
@@ -310,6 +493,32 @@ def get_sample(filename):
     return jsonify({'samples': samples})
 
 
+def count_csv_rows(filepath):
+    """Count data rows by scanning raw bytes instead of parsing every field.
+    A newline only ends a row when the quotes before it are balanced (escaped "" come in pairs)."""
+    rows = 0
+    in_quotes = False
+    partial = False  # Bytes seen since the last row ended
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            *lines, tail = chunk.split(b'\n')
+            for line in lines:
+                if line.count(b'"') & 1:
+                    in_quotes = not in_quotes
+                if in_quotes:
+                    partial = True
+                else:
+                    rows += 1
+                    partial = False
+            if tail:
+                if tail.count(b'"') & 1:
+                    in_quotes = not in_quotes
+                partial = True
+    if partial:
+        rows += 1  # Final row without a trailing newline
+    return max(rows - 1, 0)  # Subtract header
+
+
 def get_default_rules():
     """Return default transformation rules"""
     return {
@@ -373,4 +582,7 @@ if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     print("Starting Feed Optimizer Admin UI...")
     print(f"Open http://localhost:{port} in your browser")
-    app.run(host='0.0.0.0', port=port)
+    # Development server only. In production run under gunicorn, e.g.
+    #   gunicorn --workers 2 --threads 8 --bind 0.0.0.0:$PORT src.admin:app
+    # Transform job status is kept in JOBS_DIR, so any worker can answer a poll.
+    app.run(host='0.0.0.0', port=port, threaded=True)
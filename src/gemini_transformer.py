@@ -4,11 +4,14 @@ Transforms product feeds to Google Shopping/Gemini format
 """
 
 import csv
-import json
+import io
 import gzip
+from functools import partial
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
+
+import orjson
 
 from src.transformer import (
     parse_json_field,
@@ -18,6 +21,9 @@ from src.transformer import (
     get_additional_images,
     detect_product_type,
     build_q_and_a,
+    open_output,
+    put_field,
+    iter_transformed_rows,
     COMPANY_CONFIG
 )
 
@@ -31,17 +37,38 @@ GOOGLE_CATEGORY_MAP = {
     "handbag": "Apparel & Accessories > Handbags, Wallets & Cases > Handbags",
 }
 
+# Feed availability status -> Google availability enum
+GOOGLE_AVAILABILITY_MAP = {
+    "IN_STOCK": "in_stock",
+    "OUT_OF_STOCK": "out_of_stock",
+    "PRE_ORDER": "preorder",
+    "PREORDER": "preorder",
+    "BACKORDER": "backorder",
+}
+
+# Gender spellings mapped to Google's male/female values (anything else is unisex)
+MALE_GENDERS = frozenset({"male", "men", "mens"})
+FEMALE_GENDERS = frozenset({"female", "women", "womens"})
+
+# Column names for up to 10 additional images
+ADDITIONAL_IMAGE_FIELDS = ("additional_image_link",) + tuple(f"additional_image_link_{i}" for i in range(2, 11))
+
+# Every column transform_row_to_google can set: required fields first, the rest sorted
+GOOGLE_REQUIRED_FIELDS = ["id", "title", "description", "link", "image_link",
+                          "availability", "price", "brand", "condition",
+                          "identifier_exists", "mpn", "google_product_category"]
+GOOGLE_FIELD_ORDER = GOOGLE_REQUIRED_FIELDS + sorted([
+    "product_type", "item_group_id", *ADDITIONAL_IMAGE_FIELDS,
+    "color", "material", "size", "gender", "age_group", "shipping_weight",
+    "custom_label_0", "custom_label_1", "custom_label_2",
+    "native_commerce", "merchant_item_id", "consumer_notice",
+    "product_highlight", "product_detail", "structured_description",
+])
+
 
 def map_google_availability(status: str) -> str:
     """Map availability to Google's enum values."""
-    status_map = {
-        "IN_STOCK": "in_stock",
-        "OUT_OF_STOCK": "out_of_stock",
-        "PRE_ORDER": "preorder",
-        "PREORDER": "preorder",
-        "BACKORDER": "backorder",
-    }
-    return status_map.get(status.upper(), "out_of_stock")
+    return GOOGLE_AVAILABILITY_MAP.get(status.upper(), "out_of_stock")
 
 
 def map_google_condition(is_preowned: bool) -> str:
@@ -49,9 +76,10 @@ def map_google_condition(is_preowned: bool) -> str:
     return "used" if is_preowned else "new"
 
 
-def transform_row_to_google(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+def transform_row_to_google(row: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], str]]:
     """
     Transform a single row to Google Merchant Center format.
+    Returns (product, product_type), or None if the row is skipped.
 
     Google Shopping Required Fields:
     - id, title, description, link, image_link, price, availability, brand
@@ -61,14 +89,13 @@ def transform_row_to_google(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     - brand + mpn required
     """
 
-    # Parse nested JSON fields
-    description_data = parse_json_field(row.get("description", ""))
-    specs = parse_json_field(row.get("specifications", ""))
-
-    # Skip products that shouldn't be in feed
+    # Skip products that shouldn't be in feed (checked first so their JSON is never parsed)
     if row.get("call_for_price") == "true" or row.get("online") != "1":
         return None
 
+    # Parse nested JSON fields (description waits until the row passes the price check)
+    specs = parse_json_field(row.get("specifications", ""))
+
     # Detect product type
     product_type = detect_product_type(row, specs)
     is_preowned = specs.get("isPreOwned", "false").lower() == "true"
@@ -78,42 +105,49 @@ def transform_row_to_google(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     if price <= 0:
         return None
 
+    description_data = parse_json_field(row.get("description", ""))
+
     # Get MPN (required when no GTIN)
     mpn = (specs.get("baseRefNum") or specs.get("referenceNumber") or
            specs.get("reference") or specs.get("modelNumber") or specs.get("sku"))
 
-    # Build Google product object
-    product = {
-        # Required fields
-        "id": row.get("id", ""),
-        "title": row.get("title", row.get("name", ""))[:150],
-        "description": extract_description(description_data)[:5000],
-        "link": row.get("link", ""),
-        "image_link": row.get("image_link", ""),
-        "availability": map_google_availability(row.get("availability_status", "OUT_OF_STOCK")),
-        "price": f"{price:.2f} {currency}",
-        "brand": row.get("brand", "")[:70],
-
-        # Condition
-        "condition": map_google_condition(is_preowned),
-
-        # Identifier handling - luxury watches typically don't have GTINs
-        "identifier_exists": "false",  # No GTIN available
-        "mpn": str(mpn)[:70] if mpn else row.get("id", ""),
-
-        # Categories
-        "google_product_category": GOOGLE_CATEGORY_MAP.get(product_type, "Apparel & Accessories > Jewelry > Watches"),
-        "product_type": row.get("category", ""),
-
-        # Item grouping for variants
-        "item_group_id": row.get("item_group_id", "")[:70] if row.get("item_group_id") else "",
-    }
+    # Row fields used more than once below
+    product_id = row.get("id", "")
+    brand = row.get("brand", "")
+
+    # Build Google product object, leaving out fields without a value
+    product = {}
+
+    # Required fields
+    put_field(product, "id", product_id)
+    put_field(product, "title", row.get("title", row.get("name", ""))[:150])
+    put_field(product, "description", extract_description(description_data)[:5000])
+    put_field(product, "link", row.get("link", ""))
+    put_field(product, "image_link", row.get("image_link", ""))
+    product["availability"] = map_google_availability(row.get("availability_status", "OUT_OF_STOCK"))
+    product["price"] = f"{price:.2f} {currency}"
+    put_field(product, "brand", brand[:70])
+
+    # Condition
+    product["condition"] = map_google_condition(is_preowned)
+
+    # Identifier handling - luxury watches typically don't have GTINs
+    product["identifier_exists"] = "false"  # No GTIN available
+    put_field(product, "mpn", str(mpn)[:70] if mpn else product_id)
+
+    # Categories
+    product["google_product_category"] = GOOGLE_CATEGORY_MAP.get(product_type, "Apparel & Accessories > Jewelry > Watches")
+    put_field(product, "product_type", row.get("category", ""))
+
+    # Item grouping for variants
+    item_group_id = row.get("item_group_id")
+    if item_group_id:
+        product["item_group_id"] = item_group_id[:70]
 
     # Additional images (up to 10)
     additional_images = get_additional_images(row.get("additional_image_link", ""))
     if additional_images:
-        for i, img_url in enumerate(additional_images[:10]):
-            product[f"additional_image_link_{i+1}" if i > 0 else "additional_image_link"] = img_url
+        product.update(zip(ADDITIONAL_IMAGE_FIELDS, additional_images))
 
     # Optional attributes
 
@@ -136,9 +170,9 @@ def transform_row_to_google(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     gender = specs.get("gender") or row.get("gender")
     if gender:
         gender_lower = gender.lower()
-        if gender_lower in ["male", "men", "mens"]:
+        if gender_lower in MALE_GENDERS:
             product["gender"] = "male"
-        elif gender_lower in ["female", "women", "womens"]:
+        elif gender_lower in FEMALE_GENDERS:
             product["gender"] = "female"
         else:
             product["gender"] = "unisex"
@@ -166,7 +200,7 @@ def transform_row_to_google(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     product["native_commerce"] = "TRUE"
 
     # Map to checkout API - use same product ID
-    product["merchant_item_id"] = row.get("id", "")
+    product["merchant_item_id"] = product_id
 
     # Consumer notice for luxury items
     if is_preowned:
@@ -176,7 +210,6 @@ def transform_row_to_google(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
 
     # Product highlights for AI discovery (up to 10 bullet points)
     highlights = []
-    brand = row.get("brand", "")
     if brand:
         highlights.append(f"Authentic {brand} product")
     if is_preowned:
@@ -198,7 +231,7 @@ def transform_row_to_google(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     if movement:
         highlights.append(f"{movement} movement")
 
-    if product_type in ["jewelry"]:
+    if product_type == "jewelry":
         gemstones = specs.get("gemstones") or specs.get("stones")
         if gemstones:
             highlights.append(f"Features {gemstones}")
@@ -206,9 +239,8 @@ def transform_row_to_google(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     highlights.append("Free shipping available")
     highlights.append("Expert customer service")
 
-    # Join highlights as pipe-separated for Google feed
-    if highlights:
-        product["product_highlight"] = "|".join(highlights[:10])
+    # Join highlights as pipe-separated for Google feed (at most 10 can be added above)
+    product["product_highlight"] = "|".join(highlights)
 
     # Structured product details for AI understanding
     product_details = []
@@ -238,16 +270,28 @@ def transform_row_to_google(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     # Ads redirect (optional - for tracking)
     # product["ads_redirect"] = row.get("link", "") + "?utm_source=google&utm_medium=shopping"
 
-    # Remove empty values
-    product = {k: v for k, v in product.items() if v is not None and v != ""}
+    return product, product_type
 
-    # Store product type for stats
-    product["_product_type"] = product_type
 
-    return product
+def transform_row_to_google_record(output_format: str, row: Dict[str, Any]) -> Optional[Tuple[Any, str]]:
+    """
+    Transform a row into what the output writer needs: a JSONL line (bytes) for
+    'jsonl', otherwise the list of column values in GOOGLE_FIELD_ORDER.
+    Returns (record, product_type), or None if the row is skipped.
 
+    Run inside the worker processes so only compact records are pickled back.
+    """
+    result = transform_row_to_google(row)
+    if result is None:
+        return None
+    product, product_type = result
+    if output_format == "jsonl":
+        return orjson.dumps(product) + b"\n", product_type
+    return [product.get(field, "") for field in GOOGLE_FIELD_ORDER], product_type
 
-def transform_feed_to_google(input_path: str, output_path: str, output_format: str = "tsv") -> Dict[str, Any]:
+
+def transform_feed_to_google(input_path: str, output_path: str, output_format: str = "tsv",
+                             workers: int = 1) -> Dict[str, Any]:
     """
     Transform entire feed to Google Merchant Center format.
 
@@ -255,6 +299,7 @@ def transform_feed_to_google(input_path: str, output_path: str, output_format: s
         input_path: Path to input CSV file
         output_path: Path for output file
         output_format: 'tsv' (recommended), 'csv', or 'jsonl'
+        workers: Number of worker processes used to transform rows
 
     Returns:
         Statistics about the transformation
@@ -271,60 +316,31 @@ def transform_feed_to_google(input_path: str, output_path: str, output_format: s
         "errors": [],
     }
 
-    products = []
-
-    # Read and transform all products
     with open(input_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-
-        for row in reader:
-            stats["total_rows"] += 1
-
-            try:
-                product = transform_row_to_google(row)
-
-                if product:
-                    ptype = product.pop("_product_type", "unknown")
-                    stats["by_product_type"][ptype] = stats["by_product_type"].get(ptype, 0) + 1
-                    products.append(product)
-                    stats["transformed"] += 1
-                else:
-                    stats["skipped"] += 1
-
-            except Exception as e:
-                stats["errors"].append(f"Row {stats['total_rows']}: {str(e)}")
-                stats["skipped"] += 1
-
-    # Write output file
-    if output_format == "jsonl":
-        output_file = output_path + ".jsonl"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for product in products:
-                f.write(json.dumps(product) + "\n")
-
-    elif output_format in ["tsv", "csv"]:
-        delimiter = "\t" if output_format == "tsv" else ","
-        output_file = output_path + f".{output_format}"
-
-        if products:
-            # Get all unique fields
-            all_fields = set()
-            for p in products:
-                all_fields.update(p.keys())
-
-            # Order fields with required ones first
-            required_fields = ["id", "title", "description", "link", "image_link",
-                             "availability", "price", "brand", "condition",
-                             "identifier_exists", "mpn", "google_product_category"]
-
-            ordered_fields = [f for f in required_fields if f in all_fields]
-            ordered_fields += sorted([f for f in all_fields if f not in required_fields])
-
-            with open(output_file, 'w', encoding='utf-8', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=ordered_fields, delimiter=delimiter,
-                                       extrasaction='ignore', quoting=csv.QUOTE_MINIMAL)
-                writer.writeheader()
-                writer.writerows(products)
+        # Plain csv.reader rows are zipped with the header once per row, skipping
+        # csv.DictReader's per-row bookkeeping
+        reader = csv.reader(f)
+        header = next(reader, [])
+        records = iter_transformed_rows(partial(transform_row_to_google_record, output_format),
+                                        reader, header, stats, workers=workers)
+
+        # Write output file as rows are transformed
+        if output_format == "jsonl":
+            output_file = output_path + ".jsonl"
+            with open_output(output_file) as out:
+                for line in records:
+                    out.write(line)
+
+        elif output_format in ["tsv", "csv"]:
+            delimiter = "\t" if output_format == "tsv" else ","
+            output_file = output_path + f".{output_format}"
+
+            # The column set is fixed by transform_row_to_google, so rows stream
+            # straight to the output in a single pass
+            with io.TextIOWrapper(open_output(output_file), encoding='utf-8', newline='') as out:
+                writer = csv.writer(out, delimiter=delimiter, quoting=csv.QUOTE_MINIMAL)
+                writer.writerow(GOOGLE_FIELD_ORDER)
+                writer.writerows(records)
 
     stats["output_file"] = output_file
 
@@ -19,6 +19,9 @@ SFTP_FILENAME = os.environ.get('SFTP_FILENAME', 'google_products_ns-company_en_U
 BASE_DIR = Path(__file__).parent.parent
 UPLOADS_DIR = BASE_DIR / 'uploads'
 
+# Size of each read from the remote file and of the local write buffer
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
 
 def download_feed():
     """Download the product feed from SFTP"""
@@ -49,12 +52,21 @@ def download_feed():
         print(f"Remote file size: {remote_size / 1024 / 1024:.2f} MB")
         print(f"Remote file modified: {remote_mtime.isoformat()}")
 
-        # Download the file
+        # Download the file: prefetch() keeps many read requests in flight while
+        # large chunks are copied to disk
         print(f"Downloading to {local_file}...")
-        sftp.get(remote_file, str(local_file))
+        local_size = 0
+        with sftp.open(remote_file, 'rb') as remote, \
+                open(local_file, 'wb', buffering=DOWNLOAD_CHUNK_SIZE) as local:
+            remote.prefetch(remote_size)
+            while True:
+                chunk = remote.read(DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                local.write(chunk)
+                local_size += len(chunk)
 
         # Verify download
-        local_size = local_file.stat().st_size
         print(f"Downloaded: {local_size / 1024 / 1024:.2f} MB")
 
         if local_size == remote_size:
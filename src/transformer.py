@@ -4,11 +4,22 @@ Transforms 1916 Company product feeds to OpenAI Commerce format
 """
 
 import csv
-import json
+import io
+import re
 import gzip
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache, partial
+from itertools import islice, zip_longest
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+import orjson
 
 # Company Configuration
 COMPANY_CONFIG = {
@@ -22,6 +33,27 @@ COMPANY_CONFIG = {
     "return_policy_text": "To be eligible for a return, your item(s) must be unused, in their original packaging, and in the same condition that you received it.",
 }
 
+# Output files are written through a 1 MiB buffer to keep write() calls rare
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Fastest deflate level; at the default level 9 compression dominated the feed write
+GZIP_COMPRESS_LEVEL = 1
+
+# Rows are handed to worker processes in batches of this size
+ROW_BATCH_SIZE = 2000
+
+# Feed availability status -> OpenAI availability enum
+AVAILABILITY_MAP = {
+    "IN_STOCK": "in_stock",
+    "OUT_OF_STOCK": "out_of_stock",
+    "PRE_ORDER": "pre_order",
+    "BACKORDER": "backorder",
+    "PREORDER": "pre_order",
+}
+
+# Matches HTML tags stripped from descriptions
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+
 # Return window rules by product type
 RETURN_WINDOWS = {
     "new_watch": 14,
@@ -67,8 +99,8 @@ def parse_json_field(value: str) -> Any:
     if not value or value == "":
         return {}
     try:
-        return json.loads(value)
-    except (json.JSONDecodeError, TypeError):
+        return orjson.loads(value)
+    except (orjson.JSONDecodeError, TypeError):
         return {}
 
 
@@ -83,37 +115,41 @@ def extract_description(description_json: Dict) -> str:
         desc = ""
 
     # Strip HTML tags if present (basic)
-    import re
-    desc = re.sub(r'<[^>]+>', '', desc)
+    if "<" in desc:
+        desc = HTML_TAG_RE.sub('', desc)
 
     # Limit to 5000 chars per OpenAI spec
     return desc[:5000].strip()
 
 
+@lru_cache(maxsize=32)
 def map_availability(status: str) -> str:
     """Map availability status to OpenAI enum values."""
-    status_map = {
-        "IN_STOCK": "in_stock",
-        "OUT_OF_STOCK": "out_of_stock",
-        "PRE_ORDER": "pre_order",
-        "BACKORDER": "backorder",
-        "PREORDER": "pre_order",
-    }
-    return status_map.get(status.upper(), "unknown")
+    return AVAILABILITY_MAP.get(status.upper(), "unknown")
 
 
 def extract_price(price_value: str, book_price: str) -> tuple[float, str]:
     """Extract price and currency. Returns (price, currency_code)."""
+    try:
+        return _extract_price_cached(price_value, book_price)
+    except TypeError:
+        # Unhashable values (e.g. an already-parsed price list) bypass the cache
+        return _extract_price_cached.__wrapped__(price_value, book_price)
+
+
+@lru_cache(maxsize=4096)
+def _extract_price_cached(price_value: str, book_price: str) -> tuple[float, str]:
+    """Price extraction behind extract_price; cached because variants share price lists."""
     # Try to get USD price from book_price JSON first
     if book_price:
         try:
-            prices = json.loads(book_price)
+            prices = orjson.loads(book_price)
             for price_obj in prices:
                 if "ns-company-list-usd" in price_obj:
                     usd_price = price_obj["ns-company-list-usd"]
                     if usd_price and usd_price > 0:
                         return (float(usd_price), "USD")
-        except (json.JSONDecodeError, TypeError):
+        except (orjson.JSONDecodeError, TypeError):
             pass
 
     # Fall back to main price field
@@ -141,6 +177,7 @@ def build_q_and_a(row: Dict[str, Any], specs: Dict[str, Any], product_type: str)
     brand = row.get("brand", "").strip()
     title = row.get("title", "").strip()
     is_preowned = specs.get("isPreOwned", "false").lower() == "true"
+    is_rolex = brand.lower() == "rolex"
     availability = row.get("availability_status", "").upper()
 
     # ==========================================================================
@@ -163,14 +200,14 @@ def build_q_and_a(row: Dict[str, Any], specs: Dict[str, Any], product_type: str)
             qa_pairs.append(f"Q: Who makes this jewelry?\nA: This piece is crafted by {brand}, known for exceptional quality and craftsmanship.")
         elif product_type == "handbag":
             qa_pairs.append(f"Q: What brand is this bag?\nA: This is an authentic {brand} bag.")
-        elif brand.lower() == "rolex":
+        elif is_rolex:
             qa_pairs.append(f"Q: Is this an authentic Rolex?\nA: Yes, this is an authentic {brand} timepiece sold by The 1916 Company, an authorized retailer.")
         else:
             qa_pairs.append(f"Q: What brand is this?\nA: This is a {brand} product, available through The 1916 Company.")
 
     # 3. Condition (new vs pre-owned)
     if is_preowned:
-        if brand.lower() == "rolex":
+        if is_rolex:
             qa_pairs.append("Q: Is this watch certified?\nA: Yes, this is a Rolex Certified Pre-Owned watch with a 2-year international guarantee from Rolex.")
         else:
             qa_pairs.append("Q: What is the condition?\nA: This is a pre-owned item that has been professionally inspected and authenticated by our experts.")
@@ -312,8 +349,13 @@ def build_q_and_a(row: Dict[str, Any], specs: Dict[str, Any], product_type: str)
 
 def build_product_category(row: Dict[str, Any], specs: Dict[str, Any], product_type: str) -> str:
     """Build a proper category taxonomy for LLM understanding."""
-    brand = row.get("brand", "").strip()
-    category = row.get("category", "")
+    return _build_category_cached(row.get("brand", ""), row.get("category", ""), product_type)
+
+
+@lru_cache(maxsize=4096)
+def _build_category_cached(brand: str, category: str, product_type: str) -> str:
+    """Category taxonomy for one (brand, category, product_type); feeds repeat few combinations."""
+    brand = brand.strip()
 
     # Build hierarchy based on product type
     if product_type in ["new_watch", "rolex_cpo", "preowned_watch"]:
@@ -351,17 +393,52 @@ def extract_material(specs: Dict[str, Any]) -> str:
     return ", ".join(materials)[:100] if materials else ""
 
 
+def put_field(product: Dict[str, Any], key: str, value: Any) -> None:
+    """Set a product field only when it has a value (None and "" are left out)."""
+    if value is not None and value != "":
+        product[key] = value
+
+
+def build_store_fields() -> Dict[str, Any]:
+    """Store and policy fields shared by every OpenAI product, in output order."""
+    fields = {}
+
+    # Store info
+    put_field(fields, "store_name", COMPANY_CONFIG["store_name"])
+    put_field(fields, "seller_url", COMPANY_CONFIG["seller_url"])
+    put_field(fields, "store_country", COMPANY_CONFIG["store_country"])
+    put_field(fields, "target_countries", COMPANY_CONFIG["target_countries"])
+
+    # Policies (required for checkout)
+    put_field(fields, "seller_privacy_policy", COMPANY_CONFIG["seller_privacy_policy"])
+    put_field(fields, "seller_tos", COMPANY_CONFIG["seller_tos"])
+    put_field(fields, "return_policy", COMPANY_CONFIG["return_policy_text"])
+
+    return fields
+
+
+# Built once from COMPANY_CONFIG; change settings through set_company_config() to keep it in sync
+STORE_FIELDS = build_store_fields()
+
+
+def set_company_config(config: Dict[str, Any]) -> None:
+    """Update COMPANY_CONFIG and the store fields derived from it."""
+    global STORE_FIELDS
+    COMPANY_CONFIG.update(config)
+    # Rebind in one step so a transform running meanwhile never sees a partial dict
+    STORE_FIELDS = build_store_fields()
+
+
 def transform_row_to_openai(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Transform a single row to OpenAI format with enhanced LLM attributes."""
 
-    # Parse nested JSON fields
-    description_data = parse_json_field(row.get("description", ""))
-    specs = parse_json_field(row.get("specifications", ""))
-
-    # Skip products that shouldn't be in feed
+    # Skip products that shouldn't be in feed (checked first so their JSON is never parsed)
     if row.get("call_for_price") == "true" or row.get("online") != "1":
         return None
 
+    # Parse nested JSON fields (description waits until the row passes the price check)
+    specs = parse_json_field(row.get("specifications", ""))
+
     # Detect product type for return policy
     product_type = detect_product_type(row, specs)
     return_window = RETURN_WINDOWS.get(product_type, 14)
@@ -371,43 +448,40 @@ def transform_row_to_openai(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     if price <= 0:
         return None  # Skip products without valid price
 
-    # Build OpenAI product object
-    product = {
-        # Required fields
-        "item_id": row.get("id", ""),
-        "title": row.get("title", row.get("name", ""))[:150],  # Max 150 chars
-        "description": extract_description(description_data),
-        "brand": row.get("brand", "")[:70],  # Max 70 chars
-        "url": row.get("link", ""),
-        "image_url": row.get("image_link", ""),
-        "price": price,
-        "currency": currency,
-        "availability": map_availability(row.get("availability_status", "unknown")),
-
-        # OpenAI flags
-        "is_eligible_search": True,
-        "is_eligible_checkout": row.get("allow_buy_now", "").lower() == "true",
-
-        # Variant grouping
-        "group_id": row.get("item_group_id", "")[:70] if row.get("item_group_id") else None,
-        "listing_has_variations": bool(row.get("item_group_id")),
-
-        # Store info
-        "store_name": COMPANY_CONFIG["store_name"],
-        "seller_url": COMPANY_CONFIG["seller_url"],
-        "store_country": COMPANY_CONFIG["store_country"],
-        "target_countries": COMPANY_CONFIG["target_countries"],
-
-        # Policies (required for checkout)
-        "seller_privacy_policy": COMPANY_CONFIG["seller_privacy_policy"],
-        "seller_tos": COMPANY_CONFIG["seller_tos"],
-        "return_policy": COMPANY_CONFIG["return_policy_text"],
-        "return_window": return_window,
-
-        # Recommended fields
-        "condition": "used" if specs.get("isPreOwned", "false").lower() == "true" else "new",
-        "product_category": build_product_category(row, specs, product_type),
-    }
+    description_data = parse_json_field(row.get("description", ""))
+
+    group_id = row.get("item_group_id")
+
+    # Build OpenAI product object, leaving out fields without a value
+    product = {}
+
+    # Required fields
+    put_field(product, "item_id", row.get("id", ""))
+    put_field(product, "title", row.get("title", row.get("name", ""))[:150])  # Max 150 chars
+    put_field(product, "description", extract_description(description_data))
+    put_field(product, "brand", row.get("brand", "")[:70])  # Max 70 chars
+    put_field(product, "url", row.get("link", ""))
+    put_field(product, "image_url", row.get("image_link", ""))
+    product["price"] = price
+    product["currency"] = currency
+    product["availability"] = map_availability(row.get("availability_status", "unknown"))
+
+    # OpenAI flags
+    product["is_eligible_search"] = True
+    product["is_eligible_checkout"] = row.get("allow_buy_now", "").lower() == "true"
+
+    # Variant grouping
+    if group_id:
+        product["group_id"] = group_id[:70]
+    product["listing_has_variations"] = bool(group_id)
+
+    # Store info and policies (required for checkout)
+    product.update(STORE_FIELDS)
+    product["return_window"] = return_window
+
+    # Recommended fields
+    product["condition"] = "used" if specs.get("isPreOwned", "false").lower() == "true" else "new"
+    put_field(product, "product_category", build_product_category(row, specs, product_type))
 
     # Add additional images if available
     additional_images = get_additional_images(row.get("additional_image_link", ""))
@@ -474,13 +548,209 @@ def transform_row_to_openai(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     # Add product type as custom attribute (useful for filtering)
     product["_product_type"] = product_type
 
-    # Remove None values and empty strings
-    product = {k: v for k, v in product.items() if v is not None and v != ""}
-
     return product
 
 
-def transform_feed(input_path: str, output_path: str, compress: bool = True) -> Dict[str, Any]:
+def transform_row_to_openai_line(row: Dict[str, Any]) -> Optional[Tuple[bytes, str]]:
+    """
+    Transform a row and serialize it to a JSONL line.
+    Returns (line, product_type), or None if the row is skipped.
+
+    Run inside the worker processes so only bytes, not product dicts, are pickled
+    back to the parent.
+    """
+    product = transform_row_to_openai(row)
+    if not product:
+        return None
+    product_type = product.pop("_product_type", "unknown")
+    return orjson.dumps(product) + b"\n", product_type
+
+
+class BackgroundWriter(io.RawIOBase):
+    """
+    Raw stream that hands each write to a background thread, which writes it to the
+    wrapped stream. Used under gzip so deflate (which releases the GIL) overlaps with
+    reading and transforming rows. At most max_pending chunks are queued.
+    """
+
+    def __init__(self, raw: io.IOBase, max_pending: int = 4):
+        self._raw = raw
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        if self._error is not None:
+            raise self._error
+        data = bytes(b)  # b may be a view of the caller's reusable buffer
+        self._queue.put(data)
+        return len(data)
+
+    def _drain(self) -> None:
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            if self._error is None:
+                try:
+                    self._raw.write(data)
+                except Exception as e:
+                    # Keep draining so a blocked write() can't deadlock; re-raised on next call
+                    self._error = e
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        super().close()
+        self._queue.put(None)
+        self._thread.join()
+        self._raw.close()
+        if self._error is not None:
+            raise self._error
+
+
+def open_output(path: str, compress: bool = False) -> io.BufferedWriter:
+    """Open an output file for binary writing behind a large write buffer."""
+    if compress:
+        # mtime=0 keeps the gzip header (and so the output) reproducible
+        gz = gzip.GzipFile(path, 'wb', compresslevel=GZIP_COMPRESS_LEVEL, mtime=0)
+        return io.BufferedWriter(BackgroundWriter(gz), buffer_size=OUTPUT_BUFFER_SIZE)
+    return open(path, 'wb', buffering=OUTPUT_BUFFER_SIZE)
+
+
+def _transform_batch(transform: Callable, header: Optional[List[str]],
+                     rows: List[Any]) -> List[Tuple[Any, Optional[str]]]:
+    """
+    Transform a batch of rows, capturing per-row errors instead of raising.
+
+    When a CSV header is given, rows are raw csv.reader lists and are zipped into
+    dicts here (inside the worker). Blank lines are dropped and short rows padded
+    with None, as csv.DictReader does.
+    """
+    if header is not None:
+        rows = [dict(zip_longest(header, row)) for row in rows if row]
+
+    results = []
+    for row in rows:
+        try:
+            results.append((transform(row), None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+
+# Shared worker pool, stored as (workers, executor) and reused across transforms
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def _init_worker(company_config: Dict[str, Any]) -> None:
+    """Worker process initializer: adopt the parent's company config."""
+    set_company_config(company_config)
+
+
+def get_worker_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the persistent worker pool, starting it (again) for a new worker count."""
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None or _worker_pool[0] != workers:
+            # The pool is started from threaded processes (Flask request threads,
+            # BackgroundWriter), where fork can deadlock on inherited locks. Workers
+            # get COMPANY_CONFIG through the initializer, so nothing relies on fork.
+            executor = ProcessPoolExecutor(max_workers=workers,
+                                           mp_context=multiprocessing.get_context("forkserver"),
+                                           initializer=_init_worker,
+                                           initargs=(dict(COMPANY_CONFIG),))
+            _worker_pool = (workers, executor)
+        return _worker_pool[1]
+
+
+def reset_worker_pool() -> None:
+    """
+    Drop the persistent worker pool so the next transform starts fresh workers,
+    e.g. after COMPANY_CONFIG changes. Transforms still running keep the old pool
+    until they finish; its workers exit once it is garbage collected.
+    """
+    global _worker_pool
+    with _worker_pool_lock:
+        _worker_pool = None
+
+
+def transform_rows(transform: Callable, rows: Iterable[Any], header: Optional[List[str]] = None,
+                   workers: int = 1) -> Iterator[Tuple[Any, Optional[str]]]:
+    """
+    Apply a row transform to every row, yielding (result, error) pairs in input order.
+
+    Rows are dicts, or raw csv.reader lists when the CSV header is passed.
+
+    With workers > 1 the rows are fanned out in batches to the persistent worker
+    pool. Only a couple of batches per worker are in flight at once so the input
+    keeps streaming.
+    """
+    rows = iter(rows)
+    batches = iter(lambda: list(islice(rows, ROW_BATCH_SIZE)), [])
+    job = partial(_transform_batch, transform, header)
+
+    if workers <= 1:
+        for batch in batches:
+            yield from job(batch)
+        return
+
+    executor = get_worker_pool(workers)
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append(executor.submit(job, batch))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    except BrokenProcessPool:
+        # A worker died; never hand this pool out again
+        reset_worker_pool()
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def iter_transformed_rows(transform: Callable, reader: Iterable[List[str]], header: List[str],
+                          stats: Dict[str, Any], workers: int = 1) -> Iterator[Any]:
+    """
+    Run a row transform over csv.reader rows and yield each output record.
+
+    The transform returns (record, product_type), or a falsy value for rows it
+    filters out. Per-row errors and product type counts are recorded in stats
+    as rows stream through; the row totals are filled in once the input is
+    exhausted.
+    """
+    # Row counters stay local and are written to stats once the input is exhausted
+    errors = stats["errors"]
+    by_product_type = stats["by_product_type"]
+    total_rows = transformed = 0
+
+    for total_rows, (result, error) in enumerate(
+            transform_rows(transform, reader, header=header, workers=workers), 1):
+        if error is not None:
+            errors.append(f"Row {total_rows}: {error}")
+        elif result:
+            # Track product type stats
+            record, ptype = result
+            by_product_type[ptype] = by_product_type.get(ptype, 0) + 1
+            transformed += 1
+            yield record
+
+    # Every row that wasn't transformed (filtered out or failed) counts as skipped
+    stats["total_rows"] = total_rows
+    stats["transformed"] = transformed
+    stats["skipped"] = total_rows - transformed
+
+
+def transform_feed(input_path: str, output_path: str, compress: bool = True, workers: int = 1) -> Dict[str, Any]:
     """
     Transform entire feed from CSV to OpenAI JSONL format.
 
@@ -488,6 +758,7 @@ def transform_feed(input_path: str, output_path: str, compress: bool = True) ->
         input_path: Path to input CSV file
         output_path: Path for output JSONL file
         compress: Whether to gzip the output (required by OpenAI)
+        workers: Number of worker processes used to transform rows
 
     Returns:
         Statistics about the transformation
@@ -509,36 +780,21 @@ def transform_feed(input_path: str, output_path: str, compress: bool = True) ->
     output_file = output_path + (".gz" if compress else "")
 
     # Open output file (gzipped or plain)
-    if compress:
-        out_handle = gzip.open(output_file, 'wt', encoding='utf-8')
-    else:
-        out_handle = open(output_file, 'w', encoding='utf-8')
+    out_handle = open_output(output_file, compress=compress)
 
     try:
         with open(input_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            print(f"[DEBUG] CSV fieldnames: {reader.fieldnames}")
-
-            for row in reader:
-                stats["total_rows"] += 1
-
-                try:
-                    product = transform_row_to_openai(row)
-
-                    if product:
-                        # Track product type stats
-                        ptype = product.pop("_product_type", "unknown")
-                        stats["by_product_type"][ptype] = stats["by_product_type"].get(ptype, 0) + 1
-
-                        # Write JSONL line
-                        out_handle.write(json.dumps(product) + "\n")
-                        stats["transformed"] += 1
-                    else:
-                        stats["skipped"] += 1
-
-                except Exception as e:
-                    stats["errors"].append(f"Row {stats['total_rows']}: {str(e)}")
-                    stats["skipped"] += 1
+            # Plain csv.reader rows are zipped with the header inside the workers,
+            # skipping csv.DictReader's per-row bookkeeping in this process
+            reader = csv.reader(f)
+            header = next(reader, [])
+            print(f"[DEBUG] CSV fieldnames: {header}")
+
+            # Write JSONL lines as rows are transformed
+            write = out_handle.write
+            for line in iter_transformed_rows(transform_row_to_openai_line, reader, header, stats,
+                                              workers=workers):
+                write(line)
 
     finally:
         out_handle.close()
@@ -4,13 +4,19 @@ Validates product feed against OpenAI Commerce Feed specification
 """
 
 import gzip
+import io
 import json
 import re
 import sys
 from pathlib import Path
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple
 from urllib.parse import urlparse
-from collections import defaultdict
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import chain, count, islice
+
+import orjson
 
 # =============================================================================
 # OpenAI Commerce Feed Schema Definition
@@ -70,11 +76,30 @@ OPENAI_COMMERCE_SCHEMA = {
     }
 }
 
+# Feeds are read through a 1 MiB buffer to keep read() and decompress calls rare
+INPUT_BUFFER_SIZE = 1 << 20
+
+# Invalid JSON lines reported one by one; the rest are only counted
+INVALID_JSON_WARNING_LIMIT = 10
+
+# Products per batch sent to a validation worker process
+VALIDATE_BATCH_SIZE = 2000
+
+# Every schema field, in section order
+SCHEMA_FIELDS = tuple(field for section in OPENAI_COMMERCE_SCHEMA.values() for field in section)
+
+
+# Well-formed http(s) URL with a plain ASCII host; anything else goes through urlparse
+URL_RE = re.compile(r"https?://[A-Za-z0-9._~%!$&'()*+,;=:@-]+(?=[/?#]|\Z)", re.ASCII | re.IGNORECASE)
 
+
+@lru_cache(maxsize=1 << 16)
 def validate_url(value: str) -> Tuple[bool, str]:
     """Validate URL format."""
     if not value:
         return False, "Empty URL"
+    if URL_RE.match(value):
+        return True, ""
     try:
         result = urlparse(value)
         if not all([result.scheme, result.netloc]):
@@ -86,23 +111,109 @@ def validate_url(value: str) -> Tuple[bool, str]:
         return False, f"URL parse error: {str(e)}"
 
 
-def validate_field(field_name: str, value: Any, spec: Dict) -> List[str]:
-    """Validate a single field against its specification."""
+# Field type codes used by the compiled schema
+TYPE_STRING, TYPE_URL, TYPE_NUMBER, TYPE_INTEGER, TYPE_BOOLEAN, TYPE_ARRAY = range(6)
+TYPE_CODES = {
+    "string": TYPE_STRING,
+    "url": TYPE_URL,
+    "number": TYPE_NUMBER,
+    "integer": TYPE_INTEGER,
+    "boolean": TYPE_BOOLEAN,
+    "array": TYPE_ARRAY,
+}
+
+
+# Exact types accepted by the number/integer checks without an isinstance() MRO
+# walk (bool is an int subclass, so it passes both, as with isinstance)
+NUMBER_TYPES = frozenset((int, float, bool))
+INTEGER_TYPES = frozenset((int, bool))
+
+
+def compile_fast_check(field_type: int, max_len: Any, enum_set: Any,
+                       min_value: Any, max_value: Any) -> Callable[[Any], bool]:
+    """
+    Build a predicate that accepts the plain JSON values check_field would pass,
+    using exact type checks only. False means the value needs the full check.
+    """
+    if field_type == TYPE_STRING:
+        if enum_set is not None:
+            return lambda v: type(v) is str and v in enum_set and not (max_len and len(v) > max_len)
+        if max_len:
+            return lambda v: type(v) is str and len(v) <= max_len
+        return lambda v: type(v) is str
+    if field_type == TYPE_URL:
+        return lambda v: type(v) is str and validate_url(v)[0]
+    if field_type == TYPE_NUMBER:
+        if min_value is not None:
+            return lambda v: type(v) in NUMBER_TYPES and v >= min_value
+        return lambda v: type(v) in NUMBER_TYPES
+    if field_type == TYPE_INTEGER:
+        return lambda v: (type(v) in INTEGER_TYPES
+                          and (min_value is None or v >= min_value)
+                          and (max_value is None or v <= max_value))
+    if field_type == TYPE_BOOLEAN:
+        return lambda v: type(v) is bool
+    if field_type == TYPE_ARRAY:
+        return lambda v: type(v) is list
+    return lambda v: True
+
+
+def compile_field_spec(field_name: str, spec: Dict) -> Tuple:
+    """
+    Flatten a field spec into a (name, type_code, max_length, enum_set, enum, min,
+    max, fast_check) tuple. fast_check comes last so callers can use rule[-1].
+    """
+    field_type = TYPE_CODES.get(spec.get("type"))
+    max_len = spec.get("max_length")
+    enum = spec.get("enum")
+    enum_set = frozenset(enum) if enum is not None else None
+    min_value = spec.get("min")
+    max_value = spec.get("max")
+    return (
+        field_name,
+        field_type,
+        max_len,
+        enum_set,
+        enum,
+        min_value,
+        max_value,
+        compile_fast_check(field_type, max_len, enum_set, min_value, max_value),
+    )
+
+
+# Schema sections compiled once at import time
+COMPILED_SCHEMA = {
+    section: tuple(compile_field_spec(field, spec) for field, spec in fields.items())
+    for section, fields in OPENAI_COMMERCE_SCHEMA.items()
+}
+
+# Flat (field, section, rule) list walked by validate_product, in section order
+SCHEMA_CHECKS = tuple(
+    (rule[0], section, rule) for section, rules in COMPILED_SCHEMA.items() for rule in rules
+)
+
+# Schema spec dict and its compiled rule, by field name, for validate_field
+SCHEMA_RULES = {
+    field: (OPENAI_COMMERCE_SCHEMA[section][field], rule) for field, section, rule in SCHEMA_CHECKS
+}
+
+
+def check_field(rule: Tuple, value: Any) -> List[str]:
+    """Validate a single value against a compiled field spec."""
+    field_name, field_type, max_len, enum_set, enum, min_value, max_value, _ = rule
     errors = []
-    field_type = spec.get("type")
 
     # Type validation
-    if field_type == "string":
+    if field_type == TYPE_STRING:
         if not isinstance(value, str):
             errors.append(f"{field_name}: Expected string, got {type(value).__name__}")
         else:
-            max_len = spec.get("max_length")
             if max_len and len(value) > max_len:
                 errors.append(f"{field_name}: Exceeds max length {max_len} (got {len(value)})")
-            if "enum" in spec and value not in spec["enum"]:
-                errors.append(f"{field_name}: Invalid value '{value}', expected one of {spec['enum']}")
+            if enum_set is not None and value not in enum_set:
+                errors.append(f"{field_name}: Invalid value '{value}', expected one of {enum}")
 
-    elif field_type == "url":
+    elif field_type == TYPE_URL:
         if not isinstance(value, str):
             errors.append(f"{field_name}: Expected URL string, got {type(value).__name__}")
         else:
@@ -110,35 +221,50 @@ def validate_field(field_name: str, value: Any, spec: Dict) -> List[str]:
             if not valid:
                 errors.append(f"{field_name}: {msg}")
 
-    elif field_type == "number":
-        if not isinstance(value, (int, float)):
+    elif field_type == TYPE_NUMBER:
+        if type(value) not in NUMBER_TYPES and not isinstance(value, (int, float)):
             errors.append(f"{field_name}: Expected number, got {type(value).__name__}")
         else:
-            if "min" in spec and value < spec["min"]:
-                errors.append(f"{field_name}: Value {value} below minimum {spec['min']}")
+            if min_value is not None and value < min_value:
+                errors.append(f"{field_name}: Value {value} below minimum {min_value}")
 
-    elif field_type == "integer":
-        if not isinstance(value, int):
+    elif field_type == TYPE_INTEGER:
+        if type(value) not in INTEGER_TYPES and not isinstance(value, int):
             errors.append(f"{field_name}: Expected integer, got {type(value).__name__}")
         else:
-            if "min" in spec and value < spec["min"]:
-                errors.append(f"{field_name}: Value {value} below minimum {spec['min']}")
-            if "max" in spec and value > spec["max"]:
-                errors.append(f"{field_name}: Value {value} above maximum {spec['max']}")
+            if min_value is not None and value < min_value:
+                errors.append(f"{field_name}: Value {value} below minimum {min_value}")
+            if max_value is not None and value > max_value:
+                errors.append(f"{field_name}: Value {value} above maximum {max_value}")
 
-    elif field_type == "boolean":
+    elif field_type == TYPE_BOOLEAN:
         if not isinstance(value, bool):
             errors.append(f"{field_name}: Expected boolean, got {type(value).__name__}")
 
-    elif field_type == "array":
+    elif field_type == TYPE_ARRAY:
         if not isinstance(value, list):
             errors.append(f"{field_name}: Expected array, got {type(value).__name__}")
 
     return errors
 
 
-def validate_product(product: Dict, index: int) -> Dict:
-    """Validate a single product against the schema."""
+def validate_field(field_name: str, value: Any, spec: Dict) -> List[str]:
+    """Validate a single field against its specification."""
+    cached = SCHEMA_RULES.get(field_name)
+    if cached is not None and cached[0] is spec:
+        rule = cached[1]
+    else:
+        rule = compile_field_spec(field_name, spec)
+    return [] if rule[-1](value) else check_field(rule, value)
+
+
+def validate_product(product: Dict, index: int, field_presence: Dict[str, int] = None) -> Dict:
+    """Validate a single product against the schema.
+
+    If field_presence is given, the count of every schema field with a
+    non-empty value in this product is incremented, so coverage can be
+    reported without another pass over the feed.
+    """
     result = {
         "index": index,
         "item_id": product.get("item_id", f"unknown_{index}"),
@@ -149,76 +275,163 @@ def validate_product(product: Dict, index: int) -> Dict:
         "fields_present": list(product.keys()),
     }
 
-    # Check required fields
-    for field, spec in OPENAI_COMMERCE_SCHEMA["required"].items():
+    errors = result["errors"]
+    warnings = result["warnings"]
+
+    # Required field problems are errors; everything else is a warning. Each
+    # section has its own rule for which values are checked at all.
+    for field, section, rule in SCHEMA_CHECKS:
         if field not in product:
-            result["missing_required"].append(field)
-            result["errors"].append(f"Missing required field: {field}")
-        elif product[field] is None or product[field] == "":
-            result["errors"].append(f"Required field '{field}' is empty")
+            if section == "required":
+                result["missing_required"].append(field)
+                errors.append(f"Missing required field: {field}")
+            elif section == "recommended":
+                result["missing_recommended"].append(field)
+            continue
+
+        value = product[field]
+        if section == "required":
+            if value is None or value == "":
+                errors.append(f"Required field '{field}' is empty")
+            elif not rule[-1](value):
+                errors.extend(check_field(rule, value))
+            continue
+
+        if section == "recommended":
+            checked = value is not None and value != ""
+        elif section == "optional":
+            checked = value is not None
         else:
-            errors = validate_field(field, product[field], spec)
-            result["errors"].extend(errors)
+            checked = bool(value)
+        if checked and not rule[-1](value):
+            warnings.extend(check_field(rule, value))
 
-    # Check recommended fields
-    for field, spec in OPENAI_COMMERCE_SCHEMA["recommended"].items():
-        if field not in product:
-            result["missing_recommended"].append(field)
-        elif product[field] is not None and product[field] != "":
-            errors = validate_field(field, product[field], spec)
-            if errors:
-                result["warnings"].extend(errors)
-
-    # Check policy fields
-    for field, spec in OPENAI_COMMERCE_SCHEMA["policy"].items():
-        if field in product and product[field]:
-            errors = validate_field(field, product[field], spec)
-            if errors:
-                result["warnings"].extend(errors)
-
-    # Check LLM enhancement fields
-    for field, spec in OPENAI_COMMERCE_SCHEMA["llm_enhancement"].items():
-        if field in product and product[field]:
-            errors = validate_field(field, product[field], spec)
-            if errors:
-                result["warnings"].extend(errors)
-
-    # Check optional fields
-    for field, spec in OPENAI_COMMERCE_SCHEMA["optional"].items():
-        if field in product and product[field] is not None:
-            errors = validate_field(field, product[field], spec)
-            if errors:
-                result["warnings"].extend(errors)
+    if field_presence is not None:
+        for field, value in product.items():
+            if value and field in field_presence:
+                field_presence[field] += 1
 
     return result
 
 
-def load_feed(file_path: str) -> List[Dict]:
-    """Load products from JSONL file (handles gzip)."""
-    products = []
+def _validate_batch(tally: bool, start: int,
+                    products: List[Dict]) -> Tuple[List[Dict], Optional[Dict[str, int]]]:
+    """Validate a batch of products numbered from start, with its own presence tally if asked."""
+    field_presence = dict.fromkeys(SCHEMA_FIELDS, 0) if tally else None
+    results = [validate_product(p, i, field_presence) for i, p in enumerate(products, start)]
+    return results, field_presence
+
+
+def validate_products(products: Iterable[Dict], field_presence: Dict[str, int] = None,
+                      workers: int = 1) -> Iterator[Dict]:
+    """
+    Validate products one by one, yielding results in input order.
+
+    With workers > 1 the products are validated in batches by a process pool,
+    keeping only a couple of batches per worker in flight. Each batch returns
+    its own presence tally, which is merged into field_presence.
+    """
+    if workers <= 1:
+        for i, product in enumerate(products):
+            yield validate_product(product, i, field_presence)
+        return
+
+    products = iter(products)
+    batches = iter(lambda: list(islice(products, VALIDATE_BATCH_SIZE)), [])
+    starts = count(0, VALIDATE_BATCH_SIZE)
+
+    def drain(future):
+        results, presence = future.result()
+        if field_presence is not None:
+            for field, present in presence.items():
+                field_presence[field] += present
+        return results
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for start, batch in zip(starts, batches):
+            pending.append(executor.submit(_validate_batch, field_presence is not None, start, batch))
+            if len(pending) >= workers * 2:
+                yield from drain(pending.popleft())
+        while pending:
+            yield from drain(pending.popleft())
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def iter_feed(file_path: str) -> Iterator[Dict]:
+    """Yield products one at a time from a JSONL file (handles gzip)."""
     path = Path(file_path)
 
     if path.suffix == '.gz':
-        opener = gzip.open
+        # GzipFile only buffers 8 KiB; read and decompress in larger blocks
+        f = io.BufferedReader(gzip.open(path, 'rb'), buffer_size=INPUT_BUFFER_SIZE)
     else:
-        opener = open
+        f = open(path, 'rb', buffering=INPUT_BUFFER_SIZE)
 
-    with opener(path, 'rt', encoding='utf-8') as f:
+    invalid_lines = 0
+    with f:
         for line_num, line in enumerate(f, 1):
-            line = line.strip()
+            try:
+                product = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                pass
+            else:
+                yield product
+                continue
+            # Blank lines, and values orjson is stricter about than json
+            # (NaN, Infinity), go through the standard parser
+            line = line.decode('utf-8').strip()
             if not line:
                 continue
             try:
                 product = json.loads(line)
-                products.append(product)
             except json.JSONDecodeError as e:
-                print(f"Warning: Invalid JSON on line {line_num}: {e}")
+                invalid_lines += 1
+                if invalid_lines <= INVALID_JSON_WARNING_LIMIT:
+                    print(f"Warning: Invalid JSON on line {line_num}: {e}")
+            else:
+                yield product
+
+    if invalid_lines > INVALID_JSON_WARNING_LIMIT:
+        print(f"Warning: {invalid_lines - INVALID_JSON_WARNING_LIMIT:,} more invalid JSON lines not shown "
+              f"({invalid_lines:,} skipped in total)")
 
-    return products
 
+def load_feed(file_path: str) -> List[Dict]:
+    """Load products from JSONL file (handles gzip)."""
+    return list(iter_feed(file_path))
+
+
+def count_field_presence(products: List[Dict], fields) -> Dict[str, int]:
+    """Count products with a non-empty value for each field in one pass over the feed."""
+    counts = dict.fromkeys(fields, 0)
+    for product in products:
+        for field, value in product.items():
+            if value and field in counts:
+                counts[field] += 1
+    return counts
+
+
+# Quoted values and numbers, masked out when grouping error messages
+ERROR_DETAIL_RE = re.compile(r"'[^']*'|\d+")
 
-def generate_report(products: List[Dict], validation_results: List[Dict]) -> str:
-    """Generate a comprehensive validation report."""
+
+@lru_cache(maxsize=4096)
+def normalize_error(err: str) -> str:
+    """Normalize an error message for counting: quoted values become '...', numbers N."""
+    return ERROR_DETAIL_RE.sub(lambda m: "'...'" if m.group()[0] == "'" else "N", err)
+
+
+def generate_report(products: List[Dict], validation_results: List[Dict],
+                    field_presence: Dict[str, int] = None) -> str:
+    """
+    Generate a comprehensive validation report.
+
+    When field_presence is given, products only needs to hold the first few
+    products shown as samples; totals come from validation_results.
+    """
     report = []
     report.append("=" * 80)
     report.append("OPENAI COMMERCE FEED VALIDATION REPORT")
@@ -226,10 +439,13 @@ def generate_report(products: List[Dict], validation_results: List[Dict]) -> str
     report.append("")
 
     # Summary statistics
-    total = len(products)
+    total = len(validation_results)
     with_errors = sum(1 for r in validation_results if r["errors"])
     with_warnings = sum(1 for r in validation_results if r["warnings"])
     valid = total - with_errors
+    presence = field_presence
+    if presence is None:
+        presence = count_field_presence(products, SCHEMA_FIELDS)
 
     report.append("SUMMARY")
     report.append("-" * 40)
@@ -243,7 +459,7 @@ def generate_report(products: List[Dict], validation_results: List[Dict]) -> str
     report.append("REQUIRED FIELD COVERAGE")
     report.append("-" * 40)
     for field in OPENAI_COMMERCE_SCHEMA["required"]:
-        present = sum(1 for p in products if field in p and p[field])
+        present = presence[field]
         pct = (present / total * 100) if total > 0 else 0
         status = "✓" if pct == 100 else "⚠" if pct > 90 else "✗"
         report.append(f"{status} {field:25} {present:,}/{total:,} ({pct:.1f}%)")
@@ -253,7 +469,7 @@ def generate_report(products: List[Dict], validation_results: List[Dict]) -> str
     report.append("RECOMMENDED FIELD COVERAGE")
     report.append("-" * 40)
     for field in OPENAI_COMMERCE_SCHEMA["recommended"]:
-        present = sum(1 for p in products if field in p and p[field])
+        present = presence[field]
         pct = (present / total * 100) if total > 0 else 0
         report.append(f"  {field:25} {present:,}/{total:,} ({pct:.1f}%)")
     report.append("")
@@ -262,7 +478,7 @@ def generate_report(products: List[Dict], validation_results: List[Dict]) -> str
     report.append("POLICY FIELD COVERAGE (Required for Checkout)")
     report.append("-" * 40)
     for field in OPENAI_COMMERCE_SCHEMA["policy"]:
-        present = sum(1 for p in products if field in p and p[field])
+        present = presence[field]
         pct = (present / total * 100) if total > 0 else 0
         status = "✓" if pct == 100 else "⚠" if pct > 0 else "✗"
         report.append(f"{status} {field:25} {present:,}/{total:,} ({pct:.1f}%)")
@@ -272,25 +488,22 @@ def generate_report(products: List[Dict], validation_results: List[Dict]) -> str
     report.append("LLM ENHANCEMENT FIELD COVERAGE")
     report.append("-" * 40)
     for field in OPENAI_COMMERCE_SCHEMA["llm_enhancement"]:
-        present = sum(1 for p in products if field in p and p[field])
+        present = presence[field]
         pct = (present / total * 100) if total > 0 else 0
         report.append(f"  {field:25} {present:,}/{total:,} ({pct:.1f}%)")
     report.append("")
 
     # Common errors
-    error_counts = defaultdict(int)
+    error_counts = Counter()
     for r in validation_results:
         for err in r["errors"]:
-            # Normalize error messages for counting
-            err_key = re.sub(r"'[^']*'", "'...'", err)
-            err_key = re.sub(r"\d+", "N", err_key)
-            error_counts[err_key] += 1
+            error_counts[normalize_error(err)] += 1
 
     if error_counts:
         report.append("COMMON ERRORS (Top 10)")
         report.append("-" * 40)
-        for err, count in sorted(error_counts.items(), key=lambda x: -x[1])[:10]:
-            report.append(f"  [{count:,}x] {err}")
+        for err, n in error_counts.most_common(10):
+            report.append(f"  [{n:,}x] {err}")
         report.append("")
 
     # Sample products
@@ -332,27 +545,46 @@ def main():
     parser.add_argument("-o", "--output", help="Output report file")
     parser.add_argument("--json", action="store_true", help="Output as JSON")
     parser.add_argument("--verbose", "-v", action="store_true", help="Show all errors")
+    parser.add_argument("--workers", type=int, default=1, help="Number of validation worker processes")
 
     args = parser.parse_args()
 
     print(f"Loading feed from {args.input}...")
-    products = load_feed(args.input)
-    print(f"Loaded {len(products):,} products")
+    products = iter_feed(args.input)
+    # Keep the report's sample products; the rest of the feed is streamed
+    samples = list(islice(products, 3))
 
     print("Validating products...")
-    validation_results = [validate_product(p, i) for i, p in enumerate(products)]
+    # Field coverage only appears in the text report
+    field_presence = None if args.json else dict.fromkeys(SCHEMA_FIELDS, 0)
+    results = validate_products(chain(samples, products), field_presence, args.workers)
 
     if args.json:
+        # Only the counts are reported unless --verbose, so results are not kept
+        validation_results = [] if args.verbose else None
+        total = with_errors = with_warnings = 0
+        for r in results:
+            total += 1
+            if r["errors"]:
+                with_errors += 1
+            if r["warnings"]:
+                with_warnings += 1
+            if validation_results is not None:
+                validation_results.append(r)
+        print(f"Validated {total:,} products")
+
         output = {
-            "total_products": len(products),
-            "valid_products": sum(1 for r in validation_results if not r["errors"]),
-            "products_with_errors": sum(1 for r in validation_results if r["errors"]),
-            "products_with_warnings": sum(1 for r in validation_results if r["warnings"]),
-            "validation_results": validation_results if args.verbose else None,
+            "total_products": total,
+            "valid_products": total - with_errors,
+            "products_with_errors": with_errors,
+            "products_with_warnings": with_warnings,
+            "validation_results": validation_results,
         }
         print(json.dumps(output, indent=2))
     else:
-        report = generate_report(products, validation_results)
+        validation_results = list(results)
+        print(f"Validated {len(validation_results):,} products")
+        report = generate_report(samples, validation_results, field_presence)
         print(report)
 
         if args.output: